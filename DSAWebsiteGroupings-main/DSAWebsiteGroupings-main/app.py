@@ -1,132 +1,186 @@
 from flask import Flask, request, render_template, redirect, url_for, g, jsonify
+from flask.json.provider import DefaultJSONProvider
+import atexit
 import sqlite3
 import os
+import queue
+import re
 import threading
-import time
 import uuid
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from itsdangerous import BadSignature, Signer
 from markupsafe import escape
 
+# orjson is optional: use it for jsonify() when installed, stdlib json otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class OrjsonProvider(DefaultJSONProvider):
+    # same output as the default provider (sorted keys), serialised in C
+    def dumps(self, obj, **kwargs):
+        try:
+            return orjson.dumps(obj, default=self.default,
+                                option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            # orjson rejects what the stdlib accepts, e.g. ints wider than 64 bits
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+# signs the demo "uid" cookie; without SECRET_KEY a restart simply reissues
+# every uid, which loses nothing since demo state is in memory anyway
+app.secret_key = os.environ.get("SECRET_KEY") or os.urandom(32)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 DATABASE = "feed.db"
+# most posts a feed page will load; routes may ask for fewer with ?limit=
+FEED_LIMIT = 200
+# search results per page; ?limit= may raise it up to FEED_LIMIT
+SEARCH_LIMIT = 50
 
 # -------------------------
-# SIMPLE NODE / STRUCTURES
+# SQL STATEMENTS
 # -------------------------
-class Node:
-    def __init__(self, data):
-        self.node = data
-        self.left = None
-        self.right = None
-
-class Stack:
-    def __init__(self):
-        self.head = None
-        self.length = 0
-
-    def push(self, data):
-        n = Node(data)
-        n.left = self.head
-        self.head = n
-        self.length += 1
-
-    def to_list(self):
-        items = []
-        cur = self.head
-        while cur:
-            items.append(cur.node)
-            cur = cur.left
-        return items
-
-class QueueLinked:
-    """Linked-list based queue used only locally in some actions."""
-    def __init__(self):
-        self.head = None
-        self.tail = None
-        self.length = 0
-
-    def enqueue(self, data):
-        n = Node(data)
-        if not self.head:
-            self.head = n
-            self.tail = n
-        else:
-            self.tail.right = n
-            self.tail = n
-        self.length += 1
-
-    def dequeue(self):
-        if self.length == 0:
-            return None
-        n = self.head
-        self.head = self.head.right
-        self.length -= 1
-        return n.node
-
-class BST:
-    def __init__(self):
-        self.root = None
-
-    def insert(self, data):
-        # data expected as string
-        new = Node(data)
-        if not self.root:
-            self.root = new
-            return
-
-        cur = self.root
-        while True:
-            if data < cur.node:
-                if cur.left:
-                    cur = cur.left
-                else:
-                    cur.left = new
-                    return
-            else:
-                if cur.right:
-                    cur = cur.right
-                else:
-                    cur.right = new
-                    return
-
-    def dfs_search(self, word):
-        if not word:
-            return []
-        results = []
-        w = word.lower()
-
-        def walk(node):
-            if not node:
-                return
-            try:
-                if w in node.node.lower():
-                    results.append(node.node)
-            except Exception:
-                pass
-            walk(node.left)
-            walk(node.right)
-
-        walk(self.root)
-        return results
+# Shared constants so every route hands sqlite3 the same string and hits its statement cache
+SQL_PRAGMAS = """
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA mmap_size=268435456;
+    PRAGMA cache_size=-20000;
+"""
+
+# newest FEED_LIMIT posts, handed back oldest-first; {cols} comes from feed_sql()
+SQL_FEED = """
+    SELECT * FROM (
+        SELECT {cols}
+        FROM posts
+        ORDER BY id DESC
+        LIMIT ?
+    )
+    ORDER BY id
+"""
+
+SQL_SEARCH_LIKE = """
+    SELECT id, title, caption
+    FROM posts
+    WHERE (title LIKE ? ESCAPE '\\' OR caption LIKE ? ESCAPE '\\') AND id < ?
+    ORDER BY id DESC
+    LIMIT ?
+"""
+
+# title-only modes; both can be answered from idx_posts_title_nocase
+SQL_SEARCH_PREFIX = """
+    SELECT id, title, caption
+    FROM posts
+    WHERE title LIKE ? ESCAPE '\\' AND id < ?
+    ORDER BY id DESC
+    LIMIT ?
+"""
+
+SQL_SEARCH_EXACT = """
+    SELECT id, title, caption
+    FROM posts
+    WHERE title = ? COLLATE NOCASE AND id < ?
+    ORDER BY id DESC
+    LIMIT ?
+"""
+
+SQL_SEARCH_FTS = """
+    SELECT p.id, p.title, p.caption
+    FROM posts_fts f
+    JOIN posts p ON p.id = f.rowid
+    WHERE posts_fts MATCH ? AND p.id < ?
+    ORDER BY p.id DESC
+    LIMIT ?
+"""
+
+# title and caption joined by a NUL so a match can't span the two
+SQL_RELATED_CORPUS = """
+    SELECT id, COALESCE(title, '') || char(0) || COALESCE(caption, '') AS text
+    FROM posts
+"""
+
+SQL_INSERT_POST = """
+    INSERT INTO posts(title, caption, author, post_type, up, down)
+    VALUES (?, ?, ?, ?, 0, 0)
+"""
+
+SQL_VOTE = "UPDATE posts SET up = up + ?, down = down + ? WHERE id=?"
+SQL_DELETE_POST = "DELETE FROM posts WHERE id=?"
+SQL_UPDATE_POST = """
+    UPDATE posts
+    SET title = COALESCE(?, title),
+        caption = COALESCE(?, caption),
+        author = COALESCE(?, author)
+    WHERE id=?
+"""
 
 # -------------------------
 # DATABASE HELPERS
 # -------------------------
+# Connections are pooled per process: each request borrows one for its
+# lifetime and hands it back on teardown, so page caches and sqlite3's
+# compiled-statement cache stay warm without threads sharing a connection.
+DB_POOL_SIZE = 8
+_db_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+# WAL allows one writer at a time; queue this process's writers here
+# instead of in SQLite's busy handler
+_db_write_lock = threading.Lock()
+
+def dict_factory(cursor, row):
+    # rows come back as plain dicts, ready for templates and jsonify
+    fields = [column[0] for column in cursor.description]
+    return dict(zip(fields, row))
+
+def open_db():
+    conn = sqlite3.connect(DATABASE, check_same_thread=False, cached_statements=256)
+    conn.row_factory = dict_factory
+    # WAL lets readers run alongside a writer; NORMAL sync is safe in WAL mode
+    conn.executescript(SQL_PRAGMAS)
+    return conn
+
 def get_db():
     if "db" not in g:
-        # enable check_same_thread False for dev single-process
-        g.db = sqlite3.connect(DATABASE, check_same_thread=False)
-        g.db.row_factory = sqlite3.Row
+        try:
+            g.db = _db_pool.get_nowait()
+        except queue.Empty:
+            g.db = open_db()
     return g.db
 
 @app.teardown_appcontext
 def close_db(exception):
     db = g.pop("db", None)
     if db:
-        db.close()
+        if db.in_transaction:
+            db.rollback()
+        try:
+            _db_pool.put_nowait(db)
+        except queue.Full:
+            db.close()
+
+@contextmanager
+def write_db():
+    # BEGIN ... COMMIT (or ROLLBACK on error) while holding the write lock
+    db = get_db()
+    with _db_write_lock, db:
+        yield db
+
+def bulk_insert_posts(rows):
+    # rows of (title, caption, author, post_type); one transaction and one fsync for all
+    with write_db() as db:
+        db.executemany(SQL_INSERT_POST, rows)
 
 def init_db():
-    if not os.path.exists(DATABASE):
-        conn = sqlite3.connect(DATABASE)
+    fresh = not os.path.exists(DATABASE)
+    conn = sqlite3.connect(DATABASE)
+    if fresh:
         if not os.path.exists("schema.sql"):
             # Avoid crashing if schema.sql missing; create minimal schema for posts
             conn.execute("""
@@ -143,37 +197,268 @@ def init_db():
         else:
             with open("schema.sql", "r") as f:
                 conn.executescript(f.read())
-        conn.commit()
-        conn.close()
+    migrate_db(conn)
+    conn.commit()
+    # refresh planner statistics so the indexes above get picked
+    conn.execute("ANALYZE")
+    conn.close()
+
+def migrate_db(conn):
+    # covers the id/title/caption reads (LIKE search, related corpus) newest-first
+    # without touching the table; supersedes the plain idx_posts_id_desc
+    conn.execute("DROP INDEX IF EXISTS idx_posts_id_desc")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_feed ON posts(id DESC, title, caption)")
+    # case-insensitive title lookups (title = ? COLLATE NOCASE) without a scan
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_title_nocase ON posts(title COLLATE NOCASE)")
+
+    # full-text index over title/caption; trigram tokens give LIKE '%kw%' semantics
+    has_fts = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='posts_fts'"
+    ).fetchone()
+    conn.executescript("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+            title, caption, content='posts', content_rowid='id', tokenize='trigram'
+        );
+
+        CREATE TRIGGER IF NOT EXISTS posts_ai AFTER INSERT ON posts BEGIN
+            INSERT INTO posts_fts(rowid, title, caption) VALUES (new.id, new.title, new.caption);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS posts_ad AFTER DELETE ON posts BEGIN
+            INSERT INTO posts_fts(posts_fts, rowid, title, caption)
+            VALUES ('delete', old.id, old.title, old.caption);
+        END;
+
+        -- only title/caption edits touch the index, votes don't
+        CREATE TRIGGER IF NOT EXISTS posts_au AFTER UPDATE OF title, caption ON posts BEGIN
+            INSERT INTO posts_fts(posts_fts, rowid, title, caption)
+            VALUES ('delete', old.id, old.title, old.caption);
+            INSERT INTO posts_fts(rowid, title, caption) VALUES (new.id, new.title, new.caption);
+        END;
+    """)
+    if not has_fts:
+        # index posts that existed before the FTS table did
+        conn.execute("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')")
 
 # -------------------------
 # FEED / SEARCH LOGIC
 # -------------------------
-def get_feed_stack():
+# in-process feed cache; any write to posts bumps the version via invalidate_feed().
+# Held as one ((version, key), data) tuple so threads swap it in a single step
+# and never see a new tag next to old (or missing) data.
+_FEED_CACHE = (None, None)
+_feed_version = 0
+# vote flushes only change up/down, which only the feed shows, so they bump
+# this instead and leave the search and related-count caches alone
+_votes_version = 0
+
+def invalidate_feed():
+    global _feed_version
+    _feed_version += 1
+
+def invalidate_votes():
+    global _votes_version
+    _votes_version += 1
+
+def feed_limit():
+    # ?limit= can shrink the feed but never grow it past FEED_LIMIT
+    limit = request.args.get("limit", FEED_LIMIT, type=int)
+    return max(1, min(limit, FEED_LIMIT))
+
+# the post fields the lectures template reads; post_type isn't shown anywhere
+FEED_COLS = ("id", "title", "caption", "author", "up", "down")
+
+@lru_cache(maxsize=8)
+def feed_sql(cols):
+    # vote counts may be NULL in older databases
+    return SQL_FEED.format(cols=", ".join(
+        f"COALESCE({c}, 0) AS {c}" if c in ("up", "down") else c for c in cols
+    ))
+
+def get_feed_stack(limit=FEED_LIMIT, cols=FEED_COLS):
+    global _FEED_CACHE
+    tag = ((_feed_version, _votes_version), (limit, cols))
+    cached_tag, cached = _FEED_CACHE
+    if cached_tag == tag:
+        return cached
+
     db = get_db()
-    # return newest-first so front-end loop.first behaves predictably if you prepend interatives
-    rows = db.execute("SELECT * FROM posts ORDER BY id DESC").fetchall()
-    stack = Stack()
-    for r in rows:
-        # convert sqlite Row to regular dict to avoid sqlite Row quirks in templates/JS
-        stack.push({
-            "id": r["id"],
-            "title": r["title"],
-            "caption": r["caption"],
-            "author": r["author"],
-            "post_type": r["post_type"],
-            "up": r["up"] if r["up"] is not None else 0,
-            "down": r["down"] if r["down"] is not None else 0,
-        })
-    return stack.to_list()
-
-def perform_bst_search(keyword):
-    posts = get_feed_stack()
-    bst = BST()
-    for post in posts:
-        title = post.get("title", "") or ""
-        bst.insert(title)
-    return bst.dfs_search(keyword)
+    # oldest-first: the same order the old Stack produced by pushing the id DESC rows
+    data = db.execute(feed_sql(cols), (limit,)).fetchall()
+    _FEED_CACHE = (tag, data)
+    return data
+
+# trigram tokens are 3 chars long, shorter keywords can't be matched by the index
+FTS_MIN_KEYWORD = 3
+
+def like_escape(text):
+    # search input is literal text: a typed % or _ must not act as a wildcard
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def search_posts_fts(keyword, before, limit):
+    db = get_db()
+    if len(keyword) < FTS_MIN_KEYWORD:
+        pattern = f"%{like_escape(keyword)}%"
+        return db.execute(SQL_SEARCH_LIKE, (pattern, pattern, before, limit)).fetchall()
+
+    # quote as a single FTS phrase so user input can't inject query syntax
+    match = '"' + keyword.replace('"', '""') + '"'
+    return db.execute(SQL_SEARCH_FTS, (match, before, limit)).fetchall()
+
+# ?mode= on the search routes: "contains" (default) matches title or caption
+# anywhere, "prefix" and "exact" match the start of / the whole title, any case
+SEARCH_MODES = ("contains", "prefix", "exact")
+
+# "before" for the first page of results: above any rowid
+NEWEST = 2**63 - 1
+
+def search_page():
+    # keyset pagination: ?before=<last id shown> fetches the next (older) page
+    before = request.values.get("before", NEWEST, type=int)
+    limit = request.values.get("limit", SEARCH_LIMIT, type=int)
+    # clamped like limit: out-of-range ids overflow SQLite and each distinct
+    # value would take its own cached_search slot
+    return max(0, min(before, NEWEST)), max(1, min(limit, FEED_LIMIT))
+
+def find_posts(keyword, mode, before=NEWEST, limit=SEARCH_LIMIT):
+    if mode == "prefix":
+        # LIKE is case-insensitive by default, so 'kw%' becomes an index range scan
+        pattern = f"{like_escape(keyword)}%"
+        return get_db().execute(SQL_SEARCH_PREFIX, (pattern, before, limit)).fetchall()
+    if mode == "exact":
+        return get_db().execute(SQL_SEARCH_EXACT, (keyword, before, limit)).fetchall()
+    return search_posts_fts(keyword, before, limit)
+
+# lowercased title/caption per post id, rebuilt only after a write to posts;
+# one (version, texts) tuple, swapped whole like _FEED_CACHE
+_CORPUS_CACHE = (None, None)
+
+def related_corpus():
+    global _CORPUS_CACHE
+    version = _feed_version
+    cached_version, cached = _CORPUS_CACHE
+    if cached_version == version:
+        return cached
+
+    # SQLite does the concatenation; lowercasing stays in Python because
+    # SQLite's lower() only folds ASCII
+    db = get_db()
+    texts = {r["id"]: r["text"].lower() for r in db.execute(SQL_RELATED_CORPUS)}
+    _CORPUS_CACHE = (version, texts)
+    return texts
+
+def related_counts(posts):
+    # related_count: number of other posts mentioning the first word of a post's title.
+    # One pass over the table for the whole batch instead of a COUNT(*) per post.
+    first_words = {}
+    for p in posts:
+        title = (p["title"] or "").strip()
+        if title:
+            first_words[p["id"]] = title.split()[0].lower()
+
+    counts = defaultdict(int)
+    if not first_words:
+        return counts
+
+    texts = related_corpus()
+
+    # count each distinct first word once, only over posts that mention any of them
+    wanted = set(first_words.values())
+    pattern = re.compile("|".join(map(re.escape, wanted)))
+    candidates = [t for t in texts.values() if pattern.search(t)]
+    hits = {fw: sum(1 for t in candidates if fw in t) for fw in wanted}
+
+    for cid, fw in first_words.items():
+        # the post itself doesn't count as related
+        counts[cid] = hits[fw] - (fw in texts.get(cid, ""))
+    return counts
+
+def build_search_results(rows):
+    counts = related_counts(rows)
+    # rows are already fresh dicts; only the derived fields are added here
+    for post in rows:
+        caption = post["caption"] = post["caption"] or ""
+        post["title"] = post["title"] or ""
+        post["max_value"] = caption if caption.strip() else "None"
+        post["related_count"] = counts[post["id"]]
+    return rows
+
+# repeat searches (typeahead) between writes skip SQL; the feed version is part
+# of the key, so any insert/update/delete retires every cached result
+@lru_cache(maxsize=512)
+def cached_search(keyword, mode, before, limit, version):
+    return build_search_results(find_posts(keyword, mode, before, limit))
+
+def search_mode(value):
+    return value if value in SEARCH_MODES else "contains"
+
+def search_results(keyword, mode="contains", before=NEWEST, limit=SEARCH_LIMIT):
+    return cached_search(keyword, mode, before, limit, _feed_version)
+
+# -------------------------
+# VOTE BUFFER
+# -------------------------
+# Votes are counted in memory and written in one transaction every
+# VOTE_FLUSH_INTERVAL seconds, or sooner once VOTE_FLUSH_BATCH votes are waiting,
+# so a burst of clicks costs one commit.
+VOTE_FLUSH_INTERVAL = 0.1
+VOTE_FLUSH_BATCH = 50
+# post id -> [up delta, down delta]
+PENDING_VOTES = {}
+_pending_vote_count = 0
+_votes_lock = threading.Lock()
+_votes_full = threading.Event()
+_vote_flusher = None
+
+def queue_vote(id, way):
+    global _vote_flusher, _pending_vote_count
+    with _votes_lock:
+        deltas = PENDING_VOTES.setdefault(id, [0, 0])
+        deltas[0 if way == "up" else 1] += 1
+        _pending_vote_count += 1
+        if _pending_vote_count >= VOTE_FLUSH_BATCH:
+            _votes_full.set()
+        if _vote_flusher is None:
+            _vote_flusher = threading.Thread(target=vote_flush_loop, daemon=True)
+            _vote_flusher.start()
+
+def flush_votes():
+    global _pending_vote_count
+    with _votes_lock:
+        if not PENDING_VOTES:
+            return
+        pending = PENDING_VOTES.copy()
+        PENDING_VOTES.clear()
+        _pending_vote_count = 0
+
+    try:
+        # runs outside requests too (flusher thread, atexit), so borrow a
+        # pooled connection through an app context of its own
+        with app.app_context(), write_db() as db:
+            db.executemany(SQL_VOTE, [(up, down, id) for id, (up, down) in pending.items()])
+    except sqlite3.Error:
+        # put them back for the next flush
+        with _votes_lock:
+            for id, (up, down) in pending.items():
+                deltas = PENDING_VOTES.setdefault(id, [0, 0])
+                deltas[0] += up
+                deltas[1] += down
+                _pending_vote_count += up + down
+        raise
+    invalidate_votes()
+
+def vote_flush_loop():
+    while True:
+        # wake on the timer, or early when a batch fills up
+        _votes_full.wait(VOTE_FLUSH_INTERVAL)
+        _votes_full.clear()
+        try:
+            flush_votes()
+        except sqlite3.Error:
+            app.logger.exception("vote flush failed")
+
+# don't drop the last few votes on a clean shutdown
+atexit.register(flush_votes)
 
 # -------------------------
 # ROUTES
@@ -181,225 +466,151 @@ def perform_bst_search(keyword):
 @app.route("/", methods=["GET", "POST"])
 def home():
     if request.method == "POST":
-        keyword = request.form.get("search", "") or ""
-
-        db = get_db()
-        sql_results = db.execute("""
-            SELECT id, title, caption 
-            FROM posts
-            WHERE title LIKE ? OR caption LIKE ?
-            ORDER BY id DESC
-        """, (f"%{keyword}%", f"%{keyword}%")).fetchall()
-
-        results = []
-        for r in sql_results:
-            cid = r["id"]
-            title = r["title"] or ""
-            caption = r["caption"] or ""
-            max_value = caption if caption.strip() else "None"
-
-            # related_count: naive heuristic using first word of title
-            related_count = 0
-            if title.strip():
-                first_word = title.strip().split()[0]
-                q = db.execute(
-                    "SELECT COUNT(*) as c FROM posts WHERE (title LIKE ? OR caption LIKE ?) AND id != ?",
-                    (f"%{first_word}%", f"%{first_word}%", cid)
-                ).fetchone()
-                related_count = q["c"] if q is not None else 0
-
-            results.append({
-                "id": cid,
-                "title": title,
-                "caption": caption,
-                "max_value": max_value,
-                "related_count": related_count
-            })
-
-        return jsonify(results)
-
-    # default homepage load
-    posts = get_feed_stack()
-    return render_template("index.html", posts=posts)
+        keyword = (request.form.get("search") or "").strip()
+        if not keyword:
+            return jsonify([])
+
+        return jsonify(search_results(keyword, search_mode(request.form.get("mode")), *search_page()))
+
+    # default homepage load; the feed there is filled in client-side by search,
+    # so the template needs no posts
+    return render_template("index.html", search_limit=SEARCH_LIMIT)
 
 
 @app.route("/search_posts")
 def search_posts():
     q = request.args.get("q", "").strip()
-
-    db = get_db()
-    rows = db.execute("""
-        SELECT id, title, caption 
-        FROM posts
-        WHERE title LIKE ? OR caption LIKE ?
-        ORDER BY id DESC
-    """, (f"%{q}%", f"%{q}%")).fetchall()
-
-    results = []
-    for r in rows:
-        cid = r["id"]
-        title = r["title"] or ""
-        caption = r["caption"] or ""
-        max_value = caption if caption.strip() else "None"
-
-        related_count = 0
-        if title.strip():
-            first_word = title.strip().split()[0]
-            rr = db.execute(
-                "SELECT COUNT(*) as c FROM posts WHERE (title LIKE ? OR caption LIKE ?) AND id != ?",
-                (f"%{first_word}%", f"%{first_word}%", cid)
-            ).fetchone()
-            related_count = rr["c"] if rr is not None else 0
-
-        results.append({
-            "id": cid,
-            "title": title,
-            "caption": caption,
-            "max_value": max_value,
-            "related_count": related_count
-        })
-
-    return jsonify(results)
+    if not q:
+        return jsonify([])
+
+    return jsonify(search_results(q, search_mode(request.args.get("mode")), *search_page()))
+
+# demo cards shown above the real posts on /lectures; never mutated per request
+INTERACTIVE_POSTS = [
+    {
+        "id": -1,
+        "title": "Queue Interactive Demo",
+        "caption": "Real-time enqueue/dequeue visualization.",
+        "up": 0,
+        "down": 0,
+        "max_value": "N/A",
+        "related_count": 0
+    },
+    {
+        "id": -2,
+        "title": "Stack Interactive Demo",
+        "caption": "Push/pop to see LIFO behavior.",
+        "up": 0,
+        "down": 0,
+        "max_value": "N/A",
+        "related_count": 0
+    },
+    {
+        "id": -3,
+        "title": "Tree Interactive Demo",
+        "caption": "Add nodes to grow a general tree.",
+        "up": 0,
+        "down": 0,
+        "max_value": "N/A",
+        "related_count": 0
+    },
+    {
+        "id": -4,
+        "title": "Binary Tree Interactive Demo",
+        "caption": "Insert left/right nodes manually.",
+        "up": 0,
+        "down": 0,
+        "max_value": "N/A",
+        "related_count": 0
+    },
+    {
+        "id": -5,
+        "title": "Binary Search Tree Interactive Demo",
+        "caption": "Automatic BST insertion.",
+        "up": 0,
+        "down": 0,
+        "max_value": "N/A",
+        "related_count": 0
+    }
+]
 
 @app.route("/lectures", methods=["GET", "POST"])
 def lectures():
     if request.method == "POST":
-        db = get_db()
-        db.execute("""
-            INSERT INTO posts(title, caption, author, post_type, up, down)
-            VALUES (?, ?, ?, ?, 0, 0)
-        """, (
-            request.form.get("title"),
-            request.form.get("caption"),
-            request.form.get("author", "Anonymous"),
-            request.form.get("post_type", "regular")
-        ))
-        db.commit()
+        with write_db() as db:
+            db.execute(SQL_INSERT_POST, (
+                request.form.get("title"),
+                request.form.get("caption"),
+                request.form.get("author", "Anonymous"),
+                request.form.get("post_type", "regular")
+            ))
+        invalidate_feed()
         return redirect(url_for("lectures"))
 
-    db_posts = get_feed_stack()
-
-    interactive_posts = [
-        {
-            "id": -1,
-            "title": "Queue Interactive Demo",
-            "caption": "Real-time enqueue/dequeue visualization.",
-            "up": 0,
-            "down": 0
-        },
-        {
-            "id": -2,
-            "title": "Stack Interactive Demo",
-            "caption": "Push/pop to see LIFO behavior.",
-            "up": 0,
-            "down": 0
-        },
-        {
-            "id": -3,
-            "title": "Tree Interactive Demo",
-            "caption": "Add nodes to grow a general tree.",
-            "up": 0,
-            "down": 0
-        },
-        {
-            "id": -4,
-            "title": "Binary Tree Interactive Demo",
-            "caption": "Insert left/right nodes manually.",
-            "up": 0,
-            "down": 0
-        },
-        {
-            "id": -5,
-            "title": "Binary Search Tree Interactive Demo",
-            "caption": "Automatic BST insertion.",
-            "up": 0,
-            "down": 0
-        }
-    ]
+    db_posts = get_feed_stack(feed_limit())
 
-    final_posts = interactive_posts + db_posts
     # Enrich regular posts with two helper fields:
     # - max_value: show the post's caption (or 'None')
     # - related_count: number of other posts that share a keyword from this title
-    db = get_db()
-    for post in final_posts:
-        try:
-            if post.get("id", 0) > 0:
-                # max_value: use caption or 'None'
-                post["max_value"] = post.get("caption") or "None"
-
-                # related_count: use the first word of the title to find related posts
-                title = (post.get("title") or "").strip()
-                if title:
-                    first_word = title.split()[0]
-                    q = db.execute(
-                        "SELECT COUNT(*) as c FROM posts WHERE (title LIKE ? OR caption LIKE ?) AND id != ?",
-                        (f"%{first_word}%", f"%{first_word}%", post["id"]) 
-                    ).fetchone()
-                    post["related_count"] = q["c"] if q is not None else 0
-                else:
-                    post["related_count"] = 0
-            else:
-                # interactive placeholders: show N/A
-                post["max_value"] = "N/A"
-                post["related_count"] = 0
-        except Exception:
-            post["max_value"] = post.get("caption") or "None"
-            post["related_count"] = 0
+    # db_posts is the shared feed cache, so build per-request copies instead of
+    # writing into its rows
+    counts = related_counts(db_posts)
+    db_posts = [
+        {**post, "max_value": post.get("caption") or "None", "related_count": counts[post["id"]]}
+        for post in db_posts
+    ]
 
+    final_posts = INTERACTIVE_POSTS + db_posts
     return render_template("lectures.html", posts=final_posts)
 
 @app.route("/create_post", methods=["POST"])
 def create_post():
-    db = get_db()
-    db.execute("""
-        INSERT INTO posts(title, caption, author, post_type, up, down)
-        VALUES (?, ?, ?, ?, 0, 0)
-    """, (
-        request.form.get("title"),
-        request.form.get("caption"),
-        request.form.get("author", "Anonymous"),
-        request.form.get("post_type", "regular")
-    ))
-    db.commit()
+    with write_db() as db:
+        db.execute(SQL_INSERT_POST, (
+            request.form.get("title"),
+            request.form.get("caption"),
+            request.form.get("author", "Anonymous"),
+            request.form.get("post_type", "regular")
+        ))
+    invalidate_feed()
     return redirect(url_for("lectures"))
 
-@app.route("/vote/<int:id>/<string:way>", methods=["GET"])
+def valid_post(p):
+    # anything else would only fail inside executemany as a 500
+    return (
+        isinstance(p, dict)
+        and isinstance(p.get("title"), str) and p["title"] != ""
+        and all(isinstance(p.get(k), (str, type(None))) for k in ("caption", "author", "post_type"))
+    )
+
+# bulk variant of /create_post: a JSON list of {title, caption, author, post_type}
+@app.route("/create_posts", methods=["POST"])
+def create_posts():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, list) or not all(valid_post(p) for p in payload):
+        return jsonify({"ok": False, "error": "expected a list of posts with string titles"}), 400
+
+    bulk_insert_posts([
+        (p["title"], p.get("caption"), p.get("author") or "Anonymous", p.get("post_type") or "regular")
+        for p in payload
+    ])
+    invalidate_feed()
+    return jsonify({"ok": True, "created": len(payload)})
+
+# POST so link prefetchers can't cast votes; the count lands on the next flush
+@app.route("/vote/<int:id>/<string:way>", methods=["POST"])
 def vote(id, way):
-    db = get_db()
-    if way == "up":
-        db.execute("UPDATE posts SET up = up + 1 WHERE id=?", (id,))
-    else:
-        db.execute("UPDATE posts SET down = down + 1 WHERE id=?", (id,))
-    db.commit()
-    return redirect(url_for("lectures"))
+    queue_vote(id, "up" if way == "up" else "down")
+    return jsonify({"ok": True})
 
 # accept POST from fetch in your UI (was GET previously)
 @app.route("/delete/<int:id>", methods=["POST"])
 def delete(id):
-    # demonstrate queue-based delete: enqueue & dequeue then delete
-    q = QueueLinked()
-    q.enqueue(id)
-    post_id = q.dequeue()
-    if post_id is None:
-        return jsonify(status="no-op"), 200
-
-    db = get_db()
-    db.execute("DELETE FROM posts WHERE id=?", (post_id,))
-    db.commit()
+    with write_db() as db:
+        db.execute(SQL_DELETE_POST, (id,))
+    invalidate_feed()
     return jsonify(status="deleted"), 200
 
-def delayed_delete(post_id, delay=5):
-    time.sleep(delay)
-    db = get_db()
-    db.execute("DELETE FROM posts WHERE id=?", (post_id,))
-    db.commit()
-
-@app.route("/delete/<int:id>", methods=["POST"])
-def delete_post(post_id):
-    threading.Thread(target=delayed_delete, args=(post_id,5)).start()
-    return jsonify({"ok": True})
-
 # Edit should accept the same form fields used by your modal (title, caption, author)
 @app.route("/edit/<int:id>", methods=["POST"])
 def edit(id):
@@ -408,15 +619,10 @@ def edit(id):
     caption = request.form.get("caption")
     author = request.form.get("author")
 
-    db = get_db()
-    # Only update fields that were provided
-    if title is not None:
-        db.execute("UPDATE posts SET title=? WHERE id=?", (title, id))
-    if caption is not None:
-        db.execute("UPDATE posts SET caption=? WHERE id=?", (caption, id))
-    if author is not None:
-        db.execute("UPDATE posts SET author=? WHERE id=?", (author, id))
-    db.commit()
+    # Only update fields that were provided (NULL keeps the current value)
+    with write_db() as db:
+        db.execute(SQL_UPDATE_POST, (title, caption, author, id))
+    invalidate_feed()
     return redirect(url_for("lectures"))
 
 @app.route("/collaborators")
@@ -425,10 +631,85 @@ def collaborators_page():
 # ----------------------
 # In-memory storage
 # ----------------------
-queue = []
-stack = []
-tree_root = None
-bst_root = None
+# Each visitor gets their own demo structures, keyed by a signed "uid" cookie.
+# A session is only stored once it changes something; least recently used
+# sessions are dropped past MAX_DEMO_SESSIONS.
+MAX_DEMO_SESSIONS = 1024
+STATES = OrderedDict()
+STATES_LOCK = threading.Lock()
+UID_SIGNER = Signer(app.secret_key, salt="demo-uid")
+UID_RE = re.compile(r"[0-9a-f]{32}")
+
+def new_demo_state():
+    return {
+        "queue": deque(),
+        "stack": [],
+        "tree": None,
+        # level-order queue of (node, x, y, level) for tree nodes that still
+        # have a free child slot; the head is where the next insert goes
+        "tree_open": deque(),
+        "bt": None,
+        "bst": None,
+        # per-structure mutation counter and the SVG rendered at that version
+        "svg_version": {"queue": 0, "stack": 0, "tree": 0, "bt": 0, "bst": 0},
+        "svg_cache": {},
+        # held for the whole request by @locked_demo routes
+        "lock": threading.Lock(),
+    }
+
+def cookie_uid():
+    # only uids this server issued count; anything else is treated as a new visitor
+    try:
+        uid = UID_SIGNER.unsign(request.cookies.get("uid", "")).decode()
+    except (BadSignature, UnicodeDecodeError):
+        return None
+    return uid if UID_RE.fullmatch(uid) else None
+
+def demo_state():
+    if "demo_state" in g:
+        return g.demo_state
+
+    uid = cookie_uid()
+    st = None
+    if uid is not None:
+        with STATES_LOCK:
+            st = STATES.get(uid)
+            if st is not None:
+                STATES.move_to_end(uid)
+    if st is None:
+        # unknown visitors get an empty state that is only kept once
+        # save_demo_state() runs, so read-only requests never evict anyone
+        st = new_demo_state()
+        g.unsaved_uid = uid
+    g.demo_state = st
+    return st
+
+def save_demo_state(st):
+    if "unsaved_uid" not in g:
+        return
+    uid = g.pop("unsaved_uid")
+    if uid is None:
+        uid = g.new_uid = uuid.uuid4().hex
+    with STATES_LOCK:
+        STATES[uid] = st
+        STATES.move_to_end(uid)
+        if len(STATES) > MAX_DEMO_SESSIONS:
+            STATES.popitem(last=False)
+
+def locked_demo(view):
+    # serialise concurrent requests from the same visitor on their demo state
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with demo_state()["lock"]:
+            return view(*args, **kwargs)
+    return wrapper
+
+@app.after_request
+def set_uid_cookie(response):
+    uid = g.pop("new_uid", None)
+    if uid:
+        response.set_cookie("uid", UID_SIGNER.sign(uid).decode(), httponly=True, samesite="Lax")
+    return response
 
 # ----------------------
 # Tree / BST classes
@@ -438,43 +719,56 @@ class TreeNode:
         self.val = val
         self.left = None
         self.right = None
-
-# ----------------------
-# Helpers
-# ----------------------
-def escape_text(text):
-    if text is None:
-        return ""
-    return (str(text)
-            .replace("&", "&amp;")
-            .replace("<", "&lt;")
-            .replace(">", "&gt;")
-            .replace('"', "&quot;")
-            .replace("'", "&#39;"))
+        # subtree height, kept up to date by bst_insert/bst_delete
+        self.height = 1
 
 # ----------------------
 # SVG renderers
 # ----------------------
-def render_queue_svg():
-    width = max(300, 120 * max(1, len(queue)))
+# Element markup shared by the full renderers and the incremental patches
+def queue_item_svg(i, val):
+    x = 20 + i * 120
+    return (f'<rect x="{x}" y="30" width="100" height="60" rx="8" fill="#4cc9ff" stroke="#fff"/>'
+            f'<text x="{x+50}" y="65" font-size="18" text-anchor="middle" fill="#000">{escape(val)}</text>')
+
+def tree_edge_svg(x1, y1, x2, y2):
+    return f'<line x1="{x1}" y1="{y1}" x2="{x2}" y2="{y2}" stroke="#fff"/>'
+
+def tree_node_svg(x, y, val):
+    return (f'<circle cx="{x}" cy="{y}" r="25" fill="#f8c537" stroke="#fff"/>'
+            f'<text x="{x}" y="{y+5}" font-size="20" text-anchor="middle" fill="#000">{escape(val)}</text>')
+
+def bt_edge_svg(x1, y1, x2, y2):
+    return f'<line x1="{x1}" y1="{y1}" x2="{x2}" y2="{y2}" stroke="white"/>'
+
+def bt_node_svg(x, y, val):
+    return (f'<circle cx="{x}" cy="{y}" r="25" fill="#ff6b6b" stroke="white"/>'
+            f'<text x="{x}" y="{y+6}" text-anchor="middle" font-size="18" fill="black">{escape(val)}</text>')
+
+def queue_svg_width(n):
+    return max(300, 120 * max(1, n))
+
+def render_queue_svg(queue):
+    width = queue_svg_width(len(queue))
     height = 120
-    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}">']
+    # one slot per element plus the opening/closing tags, each element a single f-string
+    parts = [None] * (len(queue) + 2)
+    parts[0] = f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}">'
     for i, val in enumerate(queue):
-        x = 20 + i * 120
-        parts.append(f'<rect x="{x}" y="30" width="100" height="60" rx="8" fill="#4cc9ff" stroke="#fff"/>')
-        parts.append(f'<text x="{x+50}" y="65" font-size="18" text-anchor="middle" fill="#000">{escape_text(val)}</text>')
-    parts.append('</svg>')
+        parts[i + 1] = queue_item_svg(i, val)
+    parts[-1] = '</svg>'
     return "".join(parts)
 
-def render_stack_svg():
+def render_stack_svg(stack):
     width = 200
     height = max(120, 80 * len(stack) + 20)
-    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}">']
+    parts = [None] * (len(stack) + 2)
+    parts[0] = f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}">'
     for i, val in enumerate(reversed(stack)):
         y = 20 + i * 80
-        parts.append(f'<rect x="40" y="{y}" width="120" height="60" rx="8" fill="#90f1a9" stroke="#fff"/>')
-        parts.append(f'<text x="100" y="{y+36}" font-size="18" text-anchor="middle" fill="#000">{escape_text(val)}</text>')
-    parts.append('</svg>')
+        parts[i + 1] = (f'<rect x="40" y="{y}" width="120" height="60" rx="8" fill="#90f1a9" stroke="#fff"/>'
+                        f'<text x="100" y="{y+36}" font-size="18" text-anchor="middle" fill="#000">{escape(val)}</text>')
+    parts[-1] = '</svg>'
     return "".join(parts)
 
 def render_generic_tree_svg(root):
@@ -484,39 +778,128 @@ def render_generic_tree_svg(root):
     width, height = 1000, 500
     parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}">']
 
-    def traverse(node, x, y, level):
-        if not node:
-            return
+    # pass 1: pre-order DFS with an explicit stack, recording each node's position
+    # and each edge in flat lists (right is pushed first so left is visited first)
+    nodes, edges = [], []
+    add_node, add_edge = nodes.append, edges.append
+    todo = [(root, 500, 40, 1)]
+    push, pop = todo.append, todo.pop
+    while todo:
+        node, x, y, level = pop()
         offset = 200 / level
+        add_node((x, y, node.val))
         if node.left:
-            parts.append(f'<line x1="{x}" y1="{y}" x2="{x-offset*2}" y2="{y+80}" stroke="#fff"/>')
+            add_edge((x, y, x-offset*2, y+80))
         if node.right:
-            parts.append(f'<line x1="{x}" y1="{y}" x2="{x+offset*2}" y2="{y+80}" stroke="#fff"/>')
-        parts.append(f'<circle cx="{x}" cy="{y}" r="25" fill="#f8c537" stroke="#fff"/>')
-        parts.append(f'<text x="{x}" y="{y+5}" font-size="20" text-anchor="middle" fill="#000">{escape_text(node.val)}</text>')
-        traverse(node.left, x-offset*2, y+80, level+1)
-        traverse(node.right, x+offset*2, y+80, level+1)
+            add_edge((x, y, x+offset*2, y+80))
+            push((node.right, x+offset*2, y+80, level+1))
+        if node.left:
+            push((node.left, x-offset*2, y+80, level+1))
 
-    traverse(root, 500, 40, 1)
+    # pass 2: all edges, then all nodes, so every circle sits on top of every line
+    parts.extend([tree_edge_svg(*e) for e in edges])
+    parts.extend([tree_node_svg(*n) for n in nodes])
     parts.append('</svg>')
     return "".join(parts)
 
+# Rendered SVGs are memoised per structure. Mutations bump the structure's
+# version, so responses between mutations reuse the cached string.
+_SVG_RENDERERS = {
+    "queue": render_queue_svg,
+    "stack": render_stack_svg,
+    "tree": render_generic_tree_svg,
+    "bt": lambda root: render_binary_tree_svg(root),
+    "bst": render_generic_tree_svg,
+}
+
+def bump_svg(st, name):
+    # every mutation comes through here, which makes it the point where a new
+    # visitor's session starts being kept
+    st["svg_version"][name] += 1
+    save_demo_state(st)
+
+def render_svg(st, name):
+    version = st["svg_version"][name]
+    cached = st["svg_cache"].get(name)
+    if cached and cached[0] == version:
+        return cached[1]
+    svg = _SVG_RENDERERS[name](st[name])
+    st["svg_cache"][name] = (version, svg)
+    return svg
+
+def svg_patch(val, node, edge="", side=None, width=None):
+    # "add" patch: the client prepends the edge (so it sits under existing circles)
+    # and appends the node to the SVG it already shows, resizing it if width is set
+    return {"op": "add", "side": side, "val": str(escape(val)), "node": node, "edge": edge,
+            "width": width}
+
+def tree_child_patch(val, side, px, py, x):
+    # new child of the node drawn at (px, py), using render_generic_tree_svg's layout
+    return svg_patch(val, tree_node_svg(x, py+80, val), tree_edge_svg(px, py, x, py+80), side)
+
+def bst_insert_patch(root, val):
+    # follow the insertion path down to the freshly added leaf, tracking positions
+    parent = None
+    node, x, y, level = root, 500, 40, 1
+    while True:
+        child = node.left if val < node.val else node.right
+        if not child:
+            break
+        offset = 200 / level
+        parent, px, py = node, x, y
+        x = x-offset*2 if child is node.left else x+offset*2
+        node, y, level = child, y+80, level+1
+    if not parent:
+        return None
+    return tree_child_patch(val, "left" if parent.left is node else "right", px, py, x)
+
+def mutation_response(st, name, patch=None):
+    # Clients that already show this structure send {"patch": true} and only need
+    # the new element; everyone else, and non-append changes, get the full SVG.
+    if patch and (request.get_json(silent=True) or {}).get("patch"):
+        return jsonify({"ok": True, "patch": patch})
+    return jsonify({"ok": True, "svg": render_svg(st, name)})
+
 # ----------------------
 # BST helpers
 # ----------------------
-def bst_insert(node, val):
-    if not node:
+def _height(node):
+    return node.height if node else 0
+
+def _update_height(node):
+    node.height = 1 + max(_height(node.left), _height(node.right))
+
+def bst_insert(root, val):
+    if not root:
         return TreeNode(val)
-    if val < node.val:
-        node.left = bst_insert(node.left, val)
-    else:
-        node.right = bst_insert(node.right, val)
-    return node
+
+    # walk down to the free slot, remembering the path for the height fix-up
+    path = []
+    cur = root
+    while True:
+        path.append(cur)
+        if val < cur.val:
+            if not cur.left:
+                cur.left = TreeNode(val)
+                break
+            cur = cur.left
+        else:
+            if not cur.right:
+                cur.right = TreeNode(val)
+                break
+            cur = cur.right
+
+    for node in reversed(path):
+        _update_height(node)
+    return root
 
 # ----------------------
 # MANUAL BINARY TREE
 # ----------------------
-bt_root = None
+# layout shared by render_binary_tree_svg and the add-left/right patches
+BT_ROOT_X, BT_ROOT_Y = 500, 50
+BT_SPREAD = 200
+BT_LEVEL_GAP = 100
 
 def render_binary_tree_svg(root):
     if not root:
@@ -524,72 +907,89 @@ def render_binary_tree_svg(root):
 
     parts = ['<svg xmlns="http://www.w3.org/2000/svg" width="1000" height="500">']
 
-    def walk(node, x, y, spread):
-        if not node:
-            return
+    # explicit-stack DFS; each node's edges go out before its circle so circles sit on top
+    add = parts.append
+    todo = [(root, BT_ROOT_X, BT_ROOT_Y, BT_SPREAD)]
+    push, pop = todo.append, todo.pop
+    while todo:
+        node, x, y, spread = pop()
 
         if node.left:
-            parts.append(f'<line x1="{x}" y1="{y}" x2="{x-spread}" y2="{y+100}" stroke="white"/>')
-            walk(node.left, x-spread, y+100, spread//2)
-
+            add(bt_edge_svg(x, y, x-spread, y+BT_LEVEL_GAP))
         if node.right:
-            parts.append(f'<line x1="{x}" y1="{y}" x2="{x+spread}" y2="{y+100}" stroke="white"/>')
-            walk(node.right, x+spread, y+100, spread//2)
+            add(bt_edge_svg(x, y, x+spread, y+BT_LEVEL_GAP))
 
-        parts.append(f'<circle cx="{x}" cy="{y}" r="25" fill="#ff6b6b" stroke="white"/>')
-        parts.append(f'<text x="{x}" y="{y+6}" text-anchor="middle" font-size="18" fill="black">{escape_text(node.val)}</text>')
+        add(bt_node_svg(x, y, node.val))
 
-    walk(root, 500, 50, 200)
-    parts.append('</svg>')
+        if node.right:
+            push((node.right, x+spread, y+BT_LEVEL_GAP, spread//2))
+        if node.left:
+            push((node.left, x-spread, y+BT_LEVEL_GAP, spread//2))
+    add('</svg>')
     return "".join(parts)
 
+def bt_root_child_patch(val, side):
+    x = BT_ROOT_X - BT_SPREAD if side == "left" else BT_ROOT_X + BT_SPREAD
+    y = BT_ROOT_Y + BT_LEVEL_GAP
+    return svg_patch(val, bt_node_svg(x, y, val), bt_edge_svg(BT_ROOT_X, BT_ROOT_Y, x, y), side)
+
 @app.route("/bt/add-left", methods=["POST"])
+@locked_demo
 def bt_add_left():
-    global bt_root
+    st = demo_state()
     val = request.json.get("value", "").strip()
     if not val:
         return jsonify({"ok": False})
 
-    if not bt_root:
-        bt_root = TreeNode(val)
+    patch = None
+    if not st["bt"]:
+        st["bt"] = TreeNode(val)
+        bump_svg(st, "bt")
     else:
-        if not bt_root.left:
-            bt_root.left = TreeNode(val)
+        if not st["bt"].left:
+            st["bt"].left = TreeNode(val)
+            bump_svg(st, "bt")
+            patch = bt_root_child_patch(val, "left")
 
-    return jsonify({"ok": True, "svg": render_binary_tree_svg(bt_root)})
+    return mutation_response(st, "bt", patch)
 
 
 @app.route("/bt/add-right", methods=["POST"])
+@locked_demo
 def bt_add_right():
-    global bt_root
+    st = demo_state()
     val = request.json.get("value", "").strip()
     if not val:
         return jsonify({"ok": False})
 
-    if not bt_root:
-        bt_root = TreeNode(val)
+    patch = None
+    if not st["bt"]:
+        st["bt"] = TreeNode(val)
+        bump_svg(st, "bt")
     else:
-        if not bt_root.right:
-            bt_root.right = TreeNode(val)
+        if not st["bt"].right:
+            st["bt"].right = TreeNode(val)
+            bump_svg(st, "bt")
+            patch = bt_root_child_patch(val, "right")
 
-    return jsonify({"ok": True, "svg": render_binary_tree_svg(bt_root)})
+    return mutation_response(st, "bt", patch)
 
 
 @app.route("/bt/reset", methods=["POST"])
+@locked_demo
 def bt_reset():
-    global bt_root
-    bt_root = None
-    return jsonify({"ok": True, "svg": render_binary_tree_svg(bt_root)})
+    st = demo_state()
+    if st["bt"]:
+        st["bt"] = None
+        bump_svg(st, "bt")
+    return jsonify({"ok": True, "svg": render_svg(st, "bt")})
 
 def bst_search(node, val):
-    if not node:
-        return False
-    if node.val == val:
-        return True
-    elif val < node.val:
-        return bst_search(node.left, val)
-    else:
-        return bst_search(node.right, val)
+    while node:
+        if node.val == val:
+            return True
+        node = node.left if val < node.val else node.right
+    return False
 
 
 def bst_find_max(node):
@@ -601,100 +1001,128 @@ def bst_find_max(node):
 
 
 def bst_height(node):
-    if not node:
-        return 0
-    return 1 + max(bst_height(node.left), bst_height(node.right))
+    return _height(node)
 
 
-def bst_delete(node, val):
+def bst_delete(root, val):
+    # walk down to the node, remembering its ancestors for the height fix-up
+    path = []
+    node = root
+    while node and node.val != val:
+        path.append(node)
+        node = node.left if val < node.val else node.right
     if not node:
-        return None
-
-    if val < node.val:
-        node.left = bst_delete(node.left, val)
-    elif val > node.val:
-        node.right = bst_delete(node.right, val)
+        return root
+
+    # Two children: copy in the max of the left subtree, then unlink that node instead
+    if node.left and node.right:
+        path.append(node)
+        pred = node.left
+        while pred.right:
+            path.append(pred)
+            pred = pred.right
+        node.val = pred.val
+        node = pred
+
+    # No child / one child: splice the node out
+    child = node.left if node.left else node.right
+    if not path:
+        return child
+    parent = path[-1]
+    if parent.left is node:
+        parent.left = child
     else:
-        # ✅ Case 1: No child
-        if not node.left and not node.right:
-            return None
+        parent.right = child
 
-        # ✅ Case 2: One child
-        if not node.left:
-            return node.right
-        if not node.right:
-            return node.left
-
-        # ✅ Case 3: Two children
-        temp = bst_find_max(node.left)
-        node.val = temp
-        node.left = bst_delete(node.left, temp)
-
-    return node
+    for ancestor in reversed(path):
+        _update_height(ancestor)
+    return root
 
 # ----------------------
 # Routes
 # ----------------------
 # Queue endpoints
 @app.route("/queue/enqueue", methods=["POST"])
+@locked_demo
 def queue_enqueue():
+    st = demo_state()
     val = request.json.get("value", "").strip()
     if not val:
         return jsonify({"ok": False})
+    queue = st["queue"]
     queue.append(val)
-    return jsonify({"ok": True, "svg": render_queue_svg()})
+    bump_svg(st, "queue")
+    patch = svg_patch(val, queue_item_svg(len(queue) - 1, val),
+                      width=queue_svg_width(len(queue))) if len(queue) > 1 else None
+    return mutation_response(st, "queue", patch)
 
 @app.route("/queue/dequeue", methods=["POST"])
+@locked_demo
 def queue_dequeue():
-    if queue:
-        queue.pop(0)
-    return jsonify({"ok": True, "svg": render_queue_svg()})
+    st = demo_state()
+    if st["queue"]:
+        st["queue"].popleft()
+        bump_svg(st, "queue")
+    return jsonify({"ok": True, "svg": render_svg(st, "queue")})
 
 # Stack endpoints
 @app.route("/stack/push", methods=["POST"])
+@locked_demo
 def stack_push():
+    st = demo_state()
     val = request.json.get("value", "").strip()
     if not val:
         return jsonify({"ok": False})
-    stack.append(val)
-    return jsonify({"ok": True, "svg": render_stack_svg()})
+    st["stack"].append(val)
+    bump_svg(st, "stack")
+    return jsonify({"ok": True, "svg": render_svg(st, "stack")})
 
 @app.route("/stack/pop", methods=["POST"])
+@locked_demo
 def stack_pop():
-    if stack:
-        stack.pop()
-    return jsonify({"ok": True, "svg": render_stack_svg()})
+    st = demo_state()
+    if st["stack"]:
+        st["stack"].pop()
+        bump_svg(st, "stack")
+    return jsonify({"ok": True, "svg": render_svg(st, "stack")})
 
 # Generic tree endpoints
 @app.route("/tree/insert", methods=["POST"])
+@locked_demo
 def tree_insert_route():
-    global tree_root
+    st = demo_state()
     val = request.json.get("value", "").strip()
     if not val:
         return jsonify({"ok": False})
 
     new_node = TreeNode(val)
-    if not tree_root:
-        tree_root = new_node
+    patch = None
+    open_slots = st["tree_open"]
+    if not st["tree"]:
+        st["tree"] = new_node
+        open_slots.append((new_node, 500, 40, 1))
     else:
-        # level order insertion
-        q = [tree_root]
-        while q:
-            node = q.pop(0)
-            if not node.left:
-                node.left = new_node
-                break
-            elif not node.right:
-                node.right = new_node
-                break
-            q.append(node.left)
-            q.append(node.right)
-    return jsonify({"ok": True, "svg": render_generic_tree_svg(tree_root)})
+        # level order insertion: the first node with a free slot is at the head
+        node, x, y, level = open_slots[0]
+        offset = 200 / level
+        if not node.left:
+            node.left = new_node
+            cx = x-offset*2
+            patch = tree_child_patch(val, "left", x, y, cx)
+        else:
+            node.right = new_node
+            cx = x+offset*2
+            patch = tree_child_patch(val, "right", x, y, cx)
+            open_slots.popleft()
+        open_slots.append((new_node, cx, y+80, level+1))
+    bump_svg(st, "tree")
+    return mutation_response(st, "tree", patch)
 
 # BST endpoints
 @app.route("/bst/insert", methods=["POST"])
+@locked_demo
 def bst_insert_route():
-    global bst_root
+    st = demo_state()
     val = request.json.get("value", "").strip()
     if not val:
         return jsonify({"ok": False})
@@ -702,49 +1130,54 @@ def bst_insert_route():
         num = int(val)
     except:
         return jsonify({"ok": False, "error": "numeric only"})
-    bst_root = bst_insert(bst_root, num)
-    return jsonify({"ok": True, "svg": render_generic_tree_svg(bst_root)})
+    st["bst"] = bst_insert(st["bst"], num)
+    bump_svg(st, "bst")
+    return mutation_response(st, "bst", bst_insert_patch(st["bst"], num))
 
 @app.route("/bst/search", methods=["POST"])
+@locked_demo
 def bst_search_route():
-    global bst_root
+    st = demo_state()
     val = request.json.get("value")
     try:
         num = int(val)
     except:
         return jsonify({"ok": False})
 
-    found = bst_search(bst_root, num)
+    found = bst_search(st["bst"], num)
     return jsonify({"ok": True, "found": found})
 
 
 @app.route("/bst/max", methods=["GET"])
+@locked_demo
 def bst_max_route():
-    global bst_root
-    m = bst_find_max(bst_root)
+    m = bst_find_max(demo_state()["bst"])
     return jsonify({"ok": True, "max": m})
 
 
 @app.route("/bst/height", methods=["GET"])
+@locked_demo
 def bst_height_route():
-    global bst_root
-    h = bst_height(bst_root)
+    h = bst_height(demo_state()["bst"])
     return jsonify({"ok": True, "height": h})
 
 
 @app.route("/bst/delete", methods=["POST"])
+@locked_demo
 def bst_delete_route():
-    global bst_root
+    st = demo_state()
     val = request.json.get("value")
     try:
         num = int(val)
     except:
         return jsonify({"ok": False})
 
-    bst_root = bst_delete(bst_root, num)
-    return jsonify({"ok": True, "svg": render_generic_tree_svg(bst_root)})
+    st["bst"] = bst_delete(st["bst"], num)
+    bump_svg(st, "bst")
+    return jsonify({"ok": True, "svg": render_svg(st, "bst")})
 
 # RUN
+# dev server only; set FLASK_DEBUG=1 for the debugger and reloader
 if __name__ == "__main__":
     init_db()
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=os.environ.get("FLASK_DEBUG") == "1", threaded=True)
\ No newline at end of file
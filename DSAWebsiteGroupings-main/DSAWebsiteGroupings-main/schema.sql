@@ -1,6 +1,7 @@
 DROP TABLE IF EXISTS users;
 DROP TABLE IF EXISTS posts;
 DROP TABLE IF EXISTS comments;
+DROP TABLE IF EXISTS posts_fts;
 
 CREATE TABLE users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
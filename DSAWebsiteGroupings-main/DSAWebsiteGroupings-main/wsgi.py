@@ -0,0 +1,7 @@
+# Production entry point, run from this directory (feed.db is opened relative to it):
+#   gunicorn -w 1 -k gthread --threads 8 wsgi:app
+# Keep a single worker: the demo sessions and the feed/search caches live in
+# process memory, so extra workers would each see their own copy.
+from app import app, init_db
+
+init_db()